@@ -1,4 +1,9 @@
+import sys
 import time
+import ctypes
+import cv2
+import mss
+import numpy as np
 import pyautogui
 
 pyautogui.FAILSAFE = True
@@ -14,28 +19,110 @@ MAX_ALT_TAB_CYCLES = 20
 DELAY = 1.0
 CONF = 0.65           # lower confidence helps if your template is good
 WA_IMAGE = "whatsapp_indicator.png"   # small, unique piece of WhatsApp UI (see notes)
+WA_TITLE = "WhatsApp"                 # part of the WhatsApp window / tab title
+SW_RESTORE = 9
+
+def _next_pow2(n):
+    return 1 << (int(n) - 1).bit_length()
+
+def prepare_template(path, fft_shape):
+    # Everything that only depends on the template is computed once here,
+    # so each poll is just one haystack FFT + integral images.
+    tpl_bgr = cv2.imread(path)
+    if tpl_bgr is None:
+        raise FileNotFoundError(f"Template image '{path}' not found or unreadable (needed for the alt-tab fallback).")
+    # grayscale makes matching more tolerant (light/dark mode)
+    tpl_f32 = cv2.cvtColor(tpl_bgr, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    tpl_mean = float(tpl_f32.mean())
+    tpl_zero = tpl_f32 - tpl_mean
+    tpl_sq_sum = float((tpl_zero.astype(np.float64) ** 2).sum())
+    tpl_fft = np.conj(np.fft.rfft2(tpl_zero, s=fft_shape))
+    return tpl_f32, tpl_mean, tpl_sq_sum, tpl_fft
+
+_matcher = None  # screen grabber + template FFT, built on first use
+
+def get_matcher():
+    # Only the alt-tab fallback needs these, so the EnumWindows path never
+    # opens a screen grabber or reads the template image
+    global _matcher
+    if _matcher is None:
+        sct = mss.mss()
+        monitor = sct.monitors[1]
+        screen_gray = np.empty((monitor["height"], monitor["width"]), dtype=np.uint8)
+        fft_shape = (_next_pow2(monitor["height"]), _next_pow2(monitor["width"]))
+        tpl_f32, _, tpl_sq_sum, tpl_fft = prepare_template(WA_IMAGE, fft_shape)
+        _matcher = (sct, monitor, screen_gray, fft_shape, tpl_f32.shape, tpl_sq_sum, tpl_fft)
+    return _matcher
 
 time.sleep(3)
 
 def whatsapp_visible():
-    try:
-        # grayscale=True makes matching more tolerant (light/dark mode)
-        return pyautogui.locateOnScreen(WA_IMAGE, confidence=CONF, grayscale=True) is not None
-    except pyautogui.ImageNotFoundException:
+    # One screen grab -> grayscale -> FFT cross-correlation normalised with
+    # integral images (same score as OpenCV's TM_CCOEFF_NORMED)
+    sct, monitor, screen_gray, fft_shape, (tpl_h, tpl_w), tpl_sq_sum, tpl_fft = get_matcher()
+    tpl_n = tpl_h * tpl_w
+    img = np.asarray(sct.grab(monitor))  # BGRA
+    cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY, dst=screen_gray)
+    h, w = screen_gray.shape
+
+    haystack_fft = np.fft.rfft2(screen_gray, s=fft_shape)
+    corr = np.fft.irfft2(haystack_fft * tpl_fft, s=fft_shape)
+    num = corr[: h - tpl_h + 1, : w - tpl_w + 1]
+
+    ii, ii_sq = cv2.integral2(screen_gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+    win_sum = ii[tpl_h:, tpl_w:] - ii[:-tpl_h, tpl_w:] - ii[tpl_h:, :-tpl_w] + ii[:-tpl_h, :-tpl_w]
+    win_sq = ii_sq[tpl_h:, tpl_w:] - ii_sq[:-tpl_h, tpl_w:] - ii_sq[tpl_h:, :-tpl_w] + ii_sq[:-tpl_h, :-tpl_w]
+    win_var = np.maximum(win_sq - win_sum ** 2 / tpl_n, 0.0)
+
+    den = np.sqrt(win_var * tpl_sq_sum)
+    valid = den > 1e-6  # flat screen regions can't match a textured template
+    if not valid.any():
+        return False
+    return (num[valid] / den[valid]).max() >= CONF
+
+def focus_whatsapp_window():
+    # Ask Windows for the window by title instead of alt-tabbing through them
+    if sys.platform != "win32":
+        return False
+    from ctypes import wintypes
+    user32 = ctypes.windll.user32
+    found = []
+
+    @ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+    def enum_proc(hwnd, lparam):
+        if not user32.IsWindowVisible(hwnd):
+            return True
+        length = user32.GetWindowTextLengthW(hwnd)
+        if length:
+            buf = ctypes.create_unicode_buffer(length + 1)
+            user32.GetWindowTextW(hwnd, buf, length + 1)
+            if WA_TITLE in buf.value:
+                found.append(hwnd)
+                return False  # stop enumerating
+        return True
+
+    user32.EnumWindows(enum_proc, 0)
+    if not found:
         return False
+    user32.ShowWindow(found[0], SW_RESTORE)
+    return bool(user32.SetForegroundWindow(found[0]))
 
 print("Searching for WhatsApp window...")
-for _ in range(MAX_ALT_TAB_CYCLES):
-    if whatsapp_visible():
-        print("✅ WhatsApp window detected")
-        break
-    # alt+tab to next window
-    pyautogui.keyDown('alt')
-    pyautogui.press('tab')
-    pyautogui.keyUp('alt')
-    time.sleep(DELAY)
+if focus_whatsapp_window():
+    print("✅ WhatsApp window focused")
 else:
-    raise SystemExit("❌ WhatsApp window not found. Recheck the template image & see tips below.")
+    # Fallback: alt-tab until the template shows up on screen
+    for _ in range(MAX_ALT_TAB_CYCLES):
+        if whatsapp_visible():
+            print("✅ WhatsApp window detected")
+            break
+        # alt+tab to next window
+        pyautogui.keyDown('alt')
+        pyautogui.press('tab')
+        pyautogui.keyUp('alt')
+        time.sleep(DELAY)
+    else:
+        raise SystemExit("❌ WhatsApp window not found. Recheck the template image & see tips below.")
 
 # Ensure Chrome has focus and WA page is active
 time.sleep(0.8)
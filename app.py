@@ -1,6 +1,7 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+
+# pandas / plotly are imported inside the chart helpers below, so the form
+# renders without loading them until "Calculate BMI" is clicked
 
 # ---------------------------------------------------------
 # ✅ PAGE CONFIG
@@ -14,6 +15,52 @@ st.set_page_config(
 st.title("📊 BMI Calculator")
 st.write("Calculate your Body Mass Index with a color-coded result + chart.")
 
+# ---------------------------------------------------------
+# ✅ CACHED CHART (static part is built once, only the BMI line changes)
+# ---------------------------------------------------------
+@st.cache_data
+def _category_df():
+    import pandas as pd
+    return pd.DataFrame({
+        "Category": ["Underweight", "Normal", "Overweight", "Obese"],
+        "BMI Range": [18.4, 24.9, 29.9, 40],   # Upper range values
+        "Color": ["blue", "green", "yellow", "red"]
+    })
+
+@st.cache_resource
+def _base_fig():
+    # Shared across sessions: copy it before adding anything
+    import plotly.express as px
+    return px.bar(
+        _category_df(),
+        x="Category",
+        y="BMI Range",
+        color="Category",
+        color_discrete_map={
+            "Underweight": "blue",
+            "Normal": "green",
+            "Overweight": "yellow",
+            "Obese": "red"
+        },
+        title="BMI Category Ranges",
+    )
+
+@st.cache_resource
+def bmi_figure(bmi):
+    # One Figure per BMI value, kept as an object (no pickling per call).
+    # st.plotly_chart still serialises it to JSON on every rerun.
+    import plotly.graph_objects as go
+    fig = go.Figure(_base_fig())
+    fig.add_hline(y=bmi, line_dash="dot", line_color="black")
+    fig.add_annotation(
+        x=1.5,
+        y=bmi,
+        text=f"Your BMI: {bmi}",
+        showarrow=True,
+        arrowhead=1
+    )
+    return fig
+
 # ---------------------------------------------------------
 # ✅ USER INPUT
 # ---------------------------------------------------------
@@ -71,36 +118,7 @@ if st.button("Calculate BMI"):
     # ---------------------------------------------------------
     st.subheader("BMI Category Chart")
 
-    df = pd.DataFrame({
-        "Category": ["Underweight", "Normal", "Overweight", "Obese"],
-        "BMI Range": [18.4, 24.9, 29.9, 40],   # Upper range values
-        "Color": ["blue", "green", "yellow", "red"]
-    })
-
-    fig = px.bar(
-        df,
-        x="Category",
-        y="BMI Range",
-        color="Category",
-        color_discrete_map={
-            "Underweight": "blue",
-            "Normal": "green",
-            "Overweight": "yellow",
-            "Obese": "red"
-        },
-        title="BMI Category Ranges",
-    )
-
-    fig.add_hline(y=bmi, line_dash="dot", line_color="black")
-    fig.add_annotation(
-        x=1.5,
-        y=bmi,
-        text=f"Your BMI: {bmi}",
-        showarrow=True,
-        arrowhead=1
-    )
-
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(bmi_figure(bmi), use_container_width=True)
 
 # ---------------------------------------------------------
 # ✅ FOOTER
@@ -5,27 +5,50 @@
 #   python cricbuzz_to_notepad.py "https://www.cricbuzz.com/live-cricket-scorecard/121681/indw-vs-rsaw-final-icc-womens-world-cup-2025"
 
 from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
-import sys, time, re, pathlib
+import sys, re, pathlib
 
 URL = sys.argv[1] if len(sys.argv) > 1 else "https://www.cricbuzz.com/live-cricket-scorecard/121681/indw-vs-rsaw-final-icc-womens-world-cup-2025"
 OUT_FILE = "scorecard.txt"
+PROFILE_DIR = "pw_profile"   # persistent browser profile (keeps consent cookies between runs)
+LAUNCH_ARGS = ["--disable-blink-features=AutomationControlled"]
+
+KW_RE = re.compile(r"batter|batsman|bowling|extras|total|fall of wickets", re.I)
 
 def clean(s: str) -> str:
-    return re.sub(r"\s+\n", "\n", re.sub(r"[ \t]+", " ", s or "")).strip()
+    # Collapse whitespace runs inside each line and drop blank lines
+    lines = (" ".join(line.split()) for line in (s or "").splitlines())
+    return "\n".join(line for line in lines if line)
+
+SCROLL_STATE_JS = "[document.body.scrollHeight, window.scrollY + window.innerHeight]"
 
-def autoscroll(page, steps=10, px=1400, pause=0.6):
-    for _ in range(steps):
+def autoscroll(page, max_steps=12, px=1400, settle_ms=1500):
+    # Scroll through existing content without waiting; once at the bottom,
+    # wait for lazy-loaded sections to grow the page and stop when none do
+    for _ in range(max_steps):
         page.mouse.wheel(0, px)
-        time.sleep(pause)
+        height, bottom = page.evaluate(SCROLL_STATE_JS)
+        if bottom < height - 2:
+            continue  # more content below already
+        try:
+            page.wait_for_function("h => document.body.scrollHeight > h", arg=height, timeout=settle_ms)
+        except PWTimeout:
+            break  # at the bottom and nothing new arrived within settle_ms
 
 with sync_playwright() as p:
-    # Launch a visible browser (Chrome if available)
+    first_run = not pathlib.Path(PROFILE_DIR).exists()
+    viewport = {"width": 1360, "height": 900}
+
+    # Launch a visible browser (Chrome if available) on a persistent profile
     try:
-        browser = p.chromium.launch(channel="chrome", headless=False, slow_mo=80)
+        context = p.chromium.launch_persistent_context(
+            PROFILE_DIR, channel="chrome", headless=False, viewport=viewport, args=LAUNCH_ARGS
+        )
     except Exception:
-        browser = p.chromium.launch(headless=False, slow_mo=80)
+        context = p.chromium.launch_persistent_context(
+            PROFILE_DIR, headless=False, viewport=viewport, args=LAUNCH_ARGS
+        )
 
-    page = browser.new_page(viewport={"width": 1360, "height": 900})
+    page = context.pages[0] if context.pages else context.new_page()
     page.goto(URL, timeout=60000)
 
     # Click "Scorecard" tab if present
@@ -35,13 +58,14 @@ with sync_playwright() as p:
     except Exception:
         pass
 
-    # Dismiss common consent banners (best-effort)
-    for sel in ["button:has-text('I Accept')", "button:has-text('Accept')", "button:has-text('AGREE')"]:
-        try: page.locator(sel).first.click(timeout=1200)
-        except Exception: pass
+    # Dismiss common consent banners (best-effort); the profile remembers them afterwards
+    if first_run:
+        for sel in ["button:has-text('I Accept')", "button:has-text('Accept')", "button:has-text('AGREE')"]:
+            try: page.locator(sel).first.click(timeout=1200)
+            except Exception: pass
 
     # Nudge lazy loading
-    autoscroll(page, steps=8)
+    autoscroll(page)
 
     # Try to wait until we see something scorecard-ish
     try:
@@ -50,40 +74,32 @@ with sync_playwright() as p:
         pass  # not all layouts show "Batter" as a header
 
     # ---- Grab text, innings by innings (preferred) ----
-    text_blocks = page.evaluate(
+    # One batched call: each innings header's innerText together with the rows
+    # after it (up to the next header), so a live update can't mismatch them
+    innings = page.locator(".cb-scrd-hdr-rw").evaluate_all(
         """
-(() => {
-  const clean = s => (s || "").replace(/[ \\t]+/g," ").replace(/\\s+\\n/g,"\\n").trim();
-  const blocks = [];
-
-  // innings header bars
-  const headers = Array.from(document.querySelectorAll(".cb-scrd-hdr-rw"));
-  if (headers.length) {
-    for (let i = 0; i < headers.length; i++) {
-      const h = headers[i];
-      let txt = clean(h.innerText);
-      // collect sibling nodes until next header
-      let cur = h.parentElement?.nextElementSibling;
-      let bodyParts = [];
-      while (cur && !cur.querySelector?.(".cb-scrd-hdr-rw")) {
-        const t = clean(cur.innerText);
-        if (t) bodyParts.push(t);
-        cur = cur.nextElementSibling;
-      }
-      blocks.push(`==== ${txt} ====` + "\\n" + bodyParts.join("\\n"));
-    }
-    return blocks.filter(Boolean);
+hs => hs.map(h => {
+  const parts = [];
+  let cur = h.parentElement?.nextElementSibling;
+  while (cur && !cur.querySelector?.(".cb-scrd-hdr-rw")) {
+    parts.push(cur.innerText);
+    cur = cur.nextElementSibling;
   }
-
-  // fallback: grab the main column that usually contains scorecard
-  const main = document.querySelector(".cb-col.cb-col-67, .cb-col.cb-col-100");
-  if (main) return [clean(main.innerText)];
-
-  // last resort: whole body
-  return [clean(document.body.innerText)];
-})()
+  return {head: h.innerText, parts};
+})
         """
     )
+    if innings:
+        text_blocks = []
+        for inn in innings:
+            body = "\n".join(t for t in map(clean, inn["parts"]) if t)
+            text_blocks.append(f"==== {clean(inn['head'])} ====\n{body}")
+    else:
+        # fallback: the main column that usually contains the scorecard,
+        # or the whole body as a last resort (one call either way)
+        text_blocks = [clean(page.evaluate(
+            "() => (document.querySelector('.cb-col.cb-col-67, .cb-col.cb-col-100') || document.body).innerText"
+        ))]
 
     # If nothing meaningful was returned, take entire page text
     if not text_blocks or all(len(b.strip()) < 40 for b in text_blocks):
@@ -91,15 +107,11 @@ with sync_playwright() as p:
         text_blocks = [full_text]
 
     # Keep only the chunk(s) that contain scorecard words
-    filtered = []
-    for b in text_blocks:
-        low = b.lower()
-        if any(k in low for k in ["batter", "batsman", "bowling", "extras", "total", "fall of wickets"]):
-            filtered.append(b)
+    filtered = [b for b in text_blocks if KW_RE.search(b)]
 
     final_text = "\n\n".join(filtered if filtered else text_blocks)
     pathlib.Path(OUT_FILE).write_text(final_text, encoding="utf-8")
     print(f"\n✅ Scorecard text saved to {OUT_FILE}")
 
     input("\nDone. Press Enter to close…")
-    browser.close()
+    context.close()
@@ -3,6 +3,7 @@ import time
 import os
 import datetime
 import pyautogui
+import pyperclip
 
 # --- SAFETY / COMFORT SETTINGS ---
 pyautogui.FAILSAFE = True          # move mouse to top-left to abort
@@ -17,17 +18,19 @@ def open_notepad():
     # give Notepad time to appear and focus
     time.sleep(1.2)
 
+FORM_TEXT = (
+    "Name: Agalya\n"
+    "Address: 123, Chennai, Tamil Nadu\n"
+    "Email: agalya@example.com\n"
+    "\n"
+    "Thank you!\n"
+    "This file was created automatically by PyAutoGUI."
+)
+
 def type_form():
-    pyautogui.write("Name: Agalya", interval=0.05)
-    pyautogui.press('enter')
-    pyautogui.write("Address: 123, Chennai, Tamil Nadu", interval=0.05)
-    pyautogui.press('enter')
-    pyautogui.write("Email: agalya@example.com", interval=0.05)
-    pyautogui.press('enter')
-    pyautogui.press('enter')
-    pyautogui.write("Thank you!", interval=0.05)
-    pyautogui.press('enter')
-    pyautogui.write("This file was created automatically by PyAutoGUI.", interval=0.05)
+    # One clipboard paste instead of typing every character with a delay
+    pyperclip.copy(FORM_TEXT)
+    pyautogui.hotkey('ctrl', 'v')
 
 def save_file_to_desktop():
     # Build a unique Desktop path like: C:\Users\<you>\Desktop\auto_form-2025-11-07_21-34-12.txt
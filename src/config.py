@@ -1,18 +1,35 @@
 # src/config.py
 import os
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+log = logging.getLogger(__name__)
 
 
 # ------------ ENV LOADING ------------
 
+@lru_cache(maxsize=1)
 def load_envs() -> None:
     """
-    Load environment variables and print a small confirmation.
-    Call this once at app startup.
+    Load environment variables, configure logging and log a small confirmation.
+    Cached, so repeated calls (reloaders, re-imports) don't re-read .env.
     """
     load_dotenv()
+    # LOG_LEVEL applies to this package only (third-party loggers stay at WARNING).
+    # DEBUG shows per-batch progress; WARNING silences routine messages.
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger(__name__.rpartition(".")[0] or __name__).setLevel(
+        os.getenv("LOG_LEVEL", "INFO").upper()
+    )
 
     missing = []
     required = ["OPENAI_API_KEY", "NEON_DB_URL", "NEO4J_URI", "NEO4J_USER", "NEO4J_PASSWORD"]
@@ -22,12 +39,12 @@ def load_envs() -> None:
 
     if missing:
         # Don't crash, but it's good to know.
-        print("⚠️ Missing env vars:", ", ".join(missing))
+        log.warning("Missing env vars: %s", ", ".join(missing))
     else:
-        print("Environment variables loaded and validated successfully.")
+        log.info("Environment variables loaded and validated successfully.")
 
 
-# Load immediately when this module is imported
+# Load when this module is first imported (the settings below depend on it)
 load_envs()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -35,6 +52,12 @@ NEON_DB_URL = os.getenv("NEON_DB_URL")
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USER = os.getenv("NEO4J_USER")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+# Optional: Neo4j HTTP API base URL (e.g. http://localhost:7474) for bulk KG writes
+NEO4J_HTTP_URL = os.getenv("NEO4J_HTTP_URL")
+# Optional: Redis URL (e.g. redis://localhost:6379/0) for caching KG query results
+REDIS_URL = os.getenv("REDIS_URL")
+# Requests-per-minute limit of the OpenAI account tier; LLM calls are paced to stay under it
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
 
 
 # ------------ LLM & EMBEDDINGS ------------
@@ -42,21 +65,148 @@ NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 # You can change models here if you want
 LLM_MODEL_NAME = "gpt-3.5-turbo"
 EMBEDDING_MODEL_NAME = "text-embedding-3-large"
+VISION_MODEL_NAME = "gpt-4o-mini"
+
+# The clients are built on first use, so importing this module stays cheap
+# for scripts that never call the LLM.
+
+@lru_cache(maxsize=1)
+def get_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model=LLM_MODEL_NAME,
+        temperature=0.2,
+        api_key=OPENAI_API_KEY,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_llm_deterministic():
+    """
+    temperature=0 LLM for stable extraction/filtering results.
+    """
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model=LLM_MODEL_NAME,
+        temperature=0.0,
+        api_key=OPENAI_API_KEY,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_llm_vision():
+    """
+    Separate LLM for vision tasks (GPT-3.5-turbo does NOT support images).
+    """
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model=VISION_MODEL_NAME,
+        temperature=0.2,
+        api_key=OPENAI_API_KEY,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(
+        model=EMBEDDING_MODEL_NAME,
+        api_key=OPENAI_API_KEY,
+    )
+
+
+# ------------ RATE LIMITS ------------
+
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# e.g. "Please try again in 1.5s" / "reset after 20s" / "try again in 250ms"
+_RETRY_HINT_RE = re.compile(r"(?:try again in|reset after)\s*([\d.]+)\s*(ms|s)\b", re.IGNORECASE)
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    err_str = str(e).lower()
+    return getattr(e, "status_code", None) == 429 or "429" in err_str or "rate_limit" in err_str
+
+
+def _server_retry_after(e: Exception):
+    """
+    Delay requested by the server, from the Retry-After header or the error text.
+    """
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass  # HTTP-date form; fall through to the message / backoff
+
+    match = _RETRY_HINT_RE.search(str(e))
+    if match:
+        value = float(match.group(1))
+        return value / 1000 if match.group(2).lower() == "ms" else value
+    return None
+
+
+def retry_delay(e: Exception, attempt: int, base: float = RETRY_BASE_DELAY) -> float:
+    """
+    Seconds to wait before retrying after a rate-limit error.
+    Honours the server's hint when present, otherwise capped exponential backoff
+    with random jitter so concurrent workers don't retry in lockstep.
+    """
+    jitter = random.uniform(0, base)
+    hinted = _server_retry_after(e)
+    if hinted is not None:
+        return min(RETRY_MAX_DELAY, hinted) + jitter
+    return min(RETRY_MAX_DELAY, base * 2 ** attempt) + jitter
+
+
+# Token bucket shared by every LLM call site (threads and the KG event loop):
+# refills at OPENAI_RPM / 60 per second and allows short bursts of LLM_BURST.
+LLM_BURST = 10
+_bucket_rate = max(OPENAI_RPM, 1) / 60.0
+_bucket_tokens = float(LLM_BURST)
+_bucket_last = time.monotonic()
+_bucket_lock = threading.Lock()
+
+
+def _reserve_llm_slot() -> float:
+    """
+    Take one token from the bucket and return how long the caller must wait for it.
+    Tokens may go negative, which queues callers behind earlier reservations.
+    """
+    global _bucket_tokens, _bucket_last
+    with _bucket_lock:
+        now = time.monotonic()
+        _bucket_tokens = min(LLM_BURST, _bucket_tokens + (now - _bucket_last) * _bucket_rate)
+        _bucket_last = now
+        _bucket_tokens -= 1
+        if _bucket_tokens >= 0:
+            return 0.0
+        return -_bucket_tokens / _bucket_rate
+
+
+def rate_limited(fn):
+    """
+    Wrap an LLM call (sync or async) so it waits for a token-bucket slot first.
+    Usage: rate_limited(get_llm().invoke)(msgs)
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            delay = _reserve_llm_slot()
+            if delay:
+                await asyncio.sleep(delay)
+            return await fn(*args, **kwargs)
+        return async_wrapper
 
-llm = ChatOpenAI(
-    model=LLM_MODEL_NAME,
-    temperature=0.2,
-    api_key=OPENAI_API_KEY,
-)
-
-# Separate LLM for vision tasks (GPT-3.5-turbo does NOT support images)
-llm_vision = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.2,
-    api_key=OPENAI_API_KEY,
-)
-
-embeddings = OpenAIEmbeddings(
-    model=EMBEDDING_MODEL_NAME,
-    api_key=OPENAI_API_KEY,
-)
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        delay = _reserve_llm_slot()
+        if delay:
+            time.sleep(delay)
+        return fn(*args, **kwargs)
+    return wrapper
@@ -1,28 +1,100 @@
 # src/ingest.py
 import io
 import os
+import re
+import queue
 import base64
+import hashlib
+import logging
+import shelve
+import threading
+import time
 import fitz  # pymupdf
-from typing import List, Optional
+from PIL import Image
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage
 
 from .vector_store import add_chunks
 from .kg import upsert_kg_from_chunks
-from .config import llm, llm_vision
+from .config import RETRY_MAX_ATTEMPTS, get_llm_vision, is_rate_limit_error, rate_limited, retry_delay
+
+log = logging.getLogger(__name__)
 
 STATIC_IMG_DIR = "static/images"
 os.makedirs(STATIC_IMG_DIR, exist_ok=True)
 
+# Pages are processed concurrently so the vision API calls overlap.
+# PyMuPDF is not thread-safe, so every call into the fitz.Document is
+# serialized through this lock; only the GPT requests run in parallel.
+PAGE_WORKERS = 8
+_pdf_lock = threading.Lock()
+_xref_lock = threading.Lock()
+
+# Number of page Documents chunked and uploaded together by ingest_pdf
+DOC_BATCH_SIZE = 20
+# Chunk batches that may wait for the background uploader
+UPLOAD_QUEUE_SIZE = 2
+
+# Chunking: windows of up to CHUNK_SIZE chars that end on a sentence/line break
+CHUNK_SIZE = 1500  # Increased from 1000 for efficiency
+CHUNK_OVERLAP = 200
+SEP_RE = re.compile(r"(?<=[.!?\n])")
+
+# Images sent to the vision model are downscaled JPEGs: upload size dominates
+# the latency of each call and full-res PNGs add nothing to OCR quality.
+VISION_DPI = 150
+VISION_MAX_EDGE = 2048
+VISION_JPEG_QUALITY = 75
+
+# Content-addressed cache of vision answers, keyed by hash(image + prompt).
+# Repeated logos/headers/watermarks only cost one API call per distinct image.
+VISION_CACHE_PATH = "vision_cache.db"
+_vision_cache = shelve.open(VISION_CACHE_PATH)
+_vision_cache_lock = threading.Lock()
+
 def _encode_image_bytes(img_bytes: bytes) -> str:
     return base64.b64encode(img_bytes).decode("utf-8")
 
+def _shrink_image_bytes(img_bytes: bytes) -> bytes:
+    """
+    Re-encode an embedded image as a JPEG whose long edge is at most VISION_MAX_EDGE.
+    """
+    img = Image.open(io.BytesIO(img_bytes))
+    img.thumbnail((VISION_MAX_EDGE, VISION_MAX_EDGE), Image.Resampling.LANCZOS)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=VISION_JPEG_QUALITY)
+    return buf.getvalue()
+
+def _render_page_jpeg(page: fitz.Page) -> bytes:
+    """
+    Render a page at VISION_DPI (capped to VISION_MAX_EDGE) as JPEG bytes.
+    """
+    zoom = VISION_DPI / 72
+    long_edge = max(page.rect.width, page.rect.height) * zoom
+    if long_edge > VISION_MAX_EDGE:
+        zoom *= VISION_MAX_EDGE / long_edge
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    return pix.tobytes("jpeg", jpg_quality=VISION_JPEG_QUALITY)
+
 def _analyze_image_with_gpt(img_bytes: bytes, prompt_text: str) -> str:
     """
     Send image to GPT-4o-mini for description or OCR.
+    Expects JPEG bytes (see _render_page_jpeg / _shrink_image_bytes).
     """
+    key = hashlib.blake2b(img_bytes + prompt_text.encode("utf-8"), digest_size=16).hexdigest()
+    with _vision_cache_lock:
+        cached = _vision_cache.get(key)
+    if cached is not None:
+        return cached
+
     b64_img = _encode_image_bytes(img_bytes)
     
     message = HumanMessage(
@@ -30,57 +102,129 @@ def _analyze_image_with_gpt(img_bytes: bytes, prompt_text: str) -> str:
             {"type": "text", "text": prompt_text},
             {
                 "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{b64_img}"},
+                "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"},
             },
         ]
     )
     
     try:
-        # Robust retry logic with backoff
-        max_retries = 12
+        # Robust retry logic with jittered backoff
+        max_retries = RETRY_MAX_ATTEMPTS
         for attempt in range(max_retries):
             try:
                 # Use the vision-capable model
-                response = llm_vision.invoke([message])
-                return response.content.strip()
+                response = rate_limited(get_llm_vision().invoke)([message])
+                result = response.content.strip()
+                with _vision_cache_lock:
+                    _vision_cache[key] = result
+                    _vision_cache.sync()
+                return result
             except Exception as e:
-                err_str = str(e).lower()
-                # Check for rate limit (429 or 'rate_limit')
-                if ("429" in err_str or "rate_limit" in err_str) and attempt < max_retries - 1:
-                    wait_time = (2 ** attempt) + 2  # 3s, 4s, 6s, 10s...
-                    print(f"Rate limit hit. Retrying in {wait_time}s...")
-                    import time
+                if is_rate_limit_error(e) and attempt < max_retries - 1:
+                    wait_time = retry_delay(e, attempt)
+                    log.info("Rate limit hit. Retrying in %.1fs...", wait_time)
                     time.sleep(wait_time)
                     continue
                 else:
                     raise e
     except Exception as e:
-        print(f"Error analyzing image: {e}")
+        log.error("Error analyzing image: %s", e)
         return ""
 
+def _describe_image(
+    doc_pdf: fitz.Document,
+    xref: int,
+    doc_id: str,
+    page_num: int,
+    img_index: int,
+) -> Optional[Tuple[str, str]]:
+    """
+    Extract one embedded image, save it to disk and caption it.
+    Returns (image_path, description), or None if the image is skipped.
+    """
+    with _pdf_lock:
+        base_image = doc_pdf.extract_image(xref)
+    image_bytes = base_image["image"]
+    ext = base_image["ext"]
+    
+    # Filter small icons/lines
+    if len(image_bytes) < 10000:  # Skip images < 10KB (increased threshold)
+        return None
+        
+    # Save image locally
+    image_filename = f"{doc_id}_p{page_num+1}_i{img_index}.{ext}"
+    image_path = os.path.join(STATIC_IMG_DIR, image_filename)
+    
+    with open(image_path, "wb") as f:
+        f.write(image_bytes)
+        
+    # Generate description (from a downscaled JPEG copy)
+    try:
+        upload_bytes = _shrink_image_bytes(image_bytes)
+    except Exception as e:
+        log.warning("Could not re-encode image %s: %s", image_filename, e)
+        return None
+    description = _analyze_image_with_gpt(
+        upload_bytes,
+        "Describe this image in detail. If it's a chart or diagram, explain the data. If it contains text, transcribe it."
+    )
+    if not description:
+        return None
+    return image_path, description
+
+def _describe_image_once(
+    xref_cache: Dict[int, Future],
+    doc_pdf: fitz.Document,
+    xref: int,
+    doc_id: str,
+    page_num: int,
+    img_index: int,
+) -> Optional[Tuple[str, str]]:
+    """
+    _describe_image, but each xref is handled by the first page that reaches
+    it; pages running concurrently wait for that result instead of redoing it.
+    """
+    with _xref_lock:
+        fut = xref_cache.get(xref)
+        owner = fut is None
+        if owner:
+            fut = xref_cache[xref] = Future()
+    if owner:
+        try:
+            fut.set_result(_describe_image(doc_pdf, xref, doc_id, page_num, img_index))
+        except Exception as e:
+            fut.set_exception(e)
+    return fut.result()
+
 def _process_pdf_page(
     doc_pdf: fitz.Document, 
     page_num: int, 
     doc_id: str, 
     file_name: str,
-    deep_ocr: bool = True
+    deep_ocr: bool = True,
+    xref_cache: Optional[Dict[int, Future]] = None,
 ) -> List[Document]:
     """
     Process a single page:
     1. Extract text (fallback to VLM OCR if empty/sparse AND deep_ocr=True).
     2. Extract images -> Caption them -> Save to disk (only if deep_ocr=True).
+       Images repeated across pages (same xref) are only captioned once per
+       xref_cache.
     """
-    page = doc_pdf.load_page(page_num)
+    if xref_cache is None:
+        xref_cache = {}
+    with _pdf_lock:
+        page = doc_pdf.load_page(page_num)
+        # 1. Text Extraction
+        text = page.get_text()
     docs = []
     
-    # 1. Text Extraction
-    text = page.get_text()
-    
     # Heuristic: If text is very short, it might be a scanned page or image-heavy.
-    if len(text.strip()) < 50 and deep_ocr:
-        print(f"Page {page_num + 1} seems scanned/empty. Using VLM OCR...")
-        pix = page.get_pixmap()
-        img_bytes = pix.tobytes("png")
+    # (deep_ocr first so the text-only path skips the strip() copy)
+    if deep_ocr and len(text.strip()) < 50:
+        log.info("Page %d seems scanned/empty. Using VLM OCR...", page_num + 1)
+        with _pdf_lock:
+            img_bytes = _render_page_jpeg(page)
         ocr_text = _analyze_image_with_gpt(
             img_bytes, 
             "Transcribe the text on this page exactly as it appears. If there is Tamil text, transcribe it accurately in Tamil."
@@ -101,48 +245,143 @@ def _process_pdf_page(
 
     # 2. Image Extraction (Skip if deep_ocr is False)
     if deep_ocr:
-        image_list = page.get_images(full=True)
+        with _pdf_lock:
+            image_list = page.get_images(full=True)
         for img_index, img in enumerate(image_list):
             xref = img[0]
-            base_image = doc_pdf.extract_image(xref)
-            image_bytes = base_image["image"]
-            ext = base_image["ext"]
+            described = _describe_image_once(xref_cache, doc_pdf, xref, doc_id, page_num, img_index)
+            if described is None:
+                continue
+            image_path, description = described
+            
+            docs.append(Document(
+                page_content=f"Image Description: {description}",
+                metadata={
+                    "source": file_name,
+                    "page": page_num + 1,
+                    "doc_id": doc_id,
+                    "image_path": image_path,
+                    "type": "image"
+                }
+            ))
             
-            # Filter small icons/lines
-            if len(image_bytes) < 10000:  # Skip images < 10KB (increased threshold)
+    return docs
+
+def fast_split(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into windows of at most `size` chars, cutting right after
+    '.', '!', '?' or a newline where possible, with roughly `overlap` chars
+    shared between consecutive windows.
+    """
+    n = len(text)
+    cuts = [m.start() for m in SEP_RE.finditer(text)]
+    cuts.append(n)
+
+    out = []
+    start = 0
+    while start < n:
+        limit = start + size
+        if limit >= n:
+            end = n
+        else:
+            # Last boundary that still fits in the window; hard cut if none does
+            j = bisect_right(cuts, limit) - 1
+            end = cuts[j] if j >= 0 and cuts[j] > start else limit
+
+        piece = text[start:end].strip()
+        if piece:
+            out.append(piece)
+        if end >= n:
+            break
+
+        # Start the next window on the first boundary inside the overlap
+        k = bisect_left(cuts, end - overlap)
+        next_start = cuts[k] if cuts[k] < end else end
+        start = next_start if next_start > start else end
+    return out
+
+def _split_documents(docs: List[Document]) -> List[Document]:
+    chunks = []
+    for d in docs:
+        for piece in fast_split(d.page_content):
+            chunks.append(Document(page_content=piece, metadata=dict(d.metadata)))
+    return chunks
+
+def _iter_pdf_docs(
+    doc_pdf: fitz.Document,
+    doc_id: str,
+    file_name: str,
+    deep_ocr: bool,
+    progress_callback=None,
+) -> Iterator[Document]:
+    """
+    Yield the Documents of every page in page order.
+    At most PAGE_WORKERS pages are in flight at once, so memory stays bounded
+    while the vision API calls of neighbouring pages still overlap.
+    """
+    total_pages = len(doc_pdf)
+    xref_cache: Dict[int, Future] = {}
+    
+    # No fixed delay between pages: rate limits are handled by the
+    # 429 retry/backoff inside _analyze_image_with_gpt.
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as ex:
+        pending = deque()
+        next_page = 0
+        while pending or next_page < total_pages:
+            while next_page < total_pages and len(pending) < PAGE_WORKERS:
+                fut = ex.submit(
+                    _process_pdf_page, doc_pdf, next_page, doc_id, file_name, deep_ocr, xref_cache
+                )
+                pending.append((next_page, fut))
+                next_page += 1
+            
+            i, fut = pending.popleft()
+            try:
+                page_docs = fut.result()
+            except Exception as e:
+                log.warning("Skipping page %d due to error: %s", i + 1, e)
+                page_docs = []
+            
+            # Report progress
+            if progress_callback:
+                progress_callback(i + 1, total_pages)
+            
+            yield from page_docs
+
+def _drain(upload_q: queue.Queue, doc_id: str, upload_errors: List[Exception]) -> None:
+    """
+    Uploader thread for ingest_pdf: take chunk lists off the queue and write
+    them to the vector DB and the KG until the None sentinel arrives.
+    After the first failure, remaining batches are skipped and the error is
+    left in upload_errors for ingest_pdf to re-raise.
+    """
+    batch_num = 0
+    while True:
+        chunks = upload_q.get()
+        try:
+            if chunks is None:
+                return
+            if upload_errors:
                 continue
-                
-            # Save image locally
-            image_filename = f"{doc_id}_p{page_num+1}_i{img_index}.{ext}"
-            image_path = os.path.join(STATIC_IMG_DIR, image_filename)
             
-            with open(image_path, "wb") as f:
-                f.write(image_bytes)
-                
-            # Generate description
-            description = _analyze_image_with_gpt(
-                image_bytes,
-                "Describe this image in detail. If it's a chart or diagram, explain the data. If it contains text, transcribe it."
-            )
+            # Save to vector DB (already batched internally)
+            add_chunks(chunks)
             
-            if description:
-                docs.append(Document(
-                    page_content=f"Image Description: {description}",
-                    metadata={
-                        "source": file_name,
-                        "page": page_num + 1,
-                        "doc_id": doc_id,
-                        "image_path": image_path,
-                        "type": "image"
-                    }
-                ))
+            # Update KG for this batch
+            upsert_kg_from_chunks(chunks, doc_id=doc_id)
             
-    return docs
+            batch_num += 1
+            log.debug("Uploaded batch %d (%d chunks)", batch_num, len(chunks))
+        except Exception as e:
+            log.error("Upload failed: %s", e)
+            upload_errors.append(e)
+        finally:
+            upload_q.task_done()
 
 def ingest_pdf(file_bytes: bytes, file_name: str, doc_id: str, deep_ocr: bool = False, progress_callback=None) -> str:
     """
     Ingest PDF with optional enhanced OCR and Image handling.
-    Uses batch processing to handle large files efficiently.
+    Pages are streamed and uploaded in small batches to handle large files efficiently.
     
     Args:
         file_bytes: PDF file content
@@ -154,62 +393,30 @@ def ingest_pdf(file_bytes: bytes, file_name: str, doc_id: str, deep_ocr: bool =
     doc_pdf = fitz.open(stream=file_bytes, filetype="pdf")
     
     total_pages = len(doc_pdf)
-    print(f"Processing {file_name} ({total_pages} pages) [Deep OCR: {deep_ocr}]...")
-    
-    # Process in batches to avoid memory issues with large files
-    BATCH_SIZE = 50
+    log.info("Processing %s (%d pages) [Deep OCR: %s]...", file_name, total_pages, deep_ocr)
     
-    import time
+    # Stream page Documents and upload them in small micro-batches, so only
+    # DOC_BATCH_SIZE documents are held in memory at a time.
+    # Uploads run on a background thread so DB writes overlap with page work;
+    # the bounded queue keeps the producer at most UPLOAD_QUEUE_SIZE batches ahead.
+    upload_q = queue.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    upload_errors: List[Exception] = []
+    uploader = threading.Thread(target=_drain, args=(upload_q, doc_id, upload_errors), daemon=True)
+    uploader.start()
     
-    for batch_start in range(0, total_pages, BATCH_SIZE):
-        batch_end = min(batch_start + BATCH_SIZE, total_pages)
-        batch_docs = []
-        
-        print(f"Processing pages {batch_start + 1} to {batch_end}...")
-        
-        for i in range(batch_start, batch_end):
-            try:
-                page_docs = _process_pdf_page(doc_pdf, i, doc_id, file_name, deep_ocr=deep_ocr)
-                batch_docs.extend(page_docs)
-                
-                # Report progress
-                if progress_callback:
-                    progress_callback(i + 1, total_pages)
-                
-                # Only delay if we are doing deep OCR (which hits API)
-                if deep_ocr:
-                    time.sleep(3.0)
-                else:
-                    # No delay for pure text extraction
-                    pass 
-            except Exception as e:
-                print(f"Skipping page {i+1} due to error: {e}")
-                continue
-        
-        # Process this batch: chunk and upload
-        if batch_docs:
-            # Optimize chunk size for large documents
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1500,  # Increased from 1000 for efficiency
-                chunk_overlap=200,
-                separators=["\n\n", "\n", ".", "!", "?"]
-            )
-            
-            chunks = splitter.split_documents(batch_docs)
-            
-            # Save to vector DB (already batched internally)
-            add_chunks(chunks)
-            
-            # Update KG for this batch
-            upsert_kg_from_chunks(chunks, doc_id=doc_id)
-            
-            print(f"Uploaded batch {batch_start // BATCH_SIZE + 1} ({len(chunks)} chunks)")
-            
-            # Clear batch from memory
-            del batch_docs
-            del chunks
+    docs_iter = _iter_pdf_docs(doc_pdf, doc_id, file_name, deep_ocr, progress_callback)
+    try:
+        while not upload_errors and (batch_docs := list(islice(docs_iter, DOC_BATCH_SIZE))):
+            upload_q.put(_split_documents(batch_docs))
+    finally:
+        upload_q.put(None)
+        upload_q.join()
+        docs_iter.close()
     
     doc_pdf.close()
     
+    if upload_errors:
+        raise upload_errors[0]
+    
     return doc_id
 
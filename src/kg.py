@@ -1,18 +1,50 @@
 # src/kg.py
 from __future__ import annotations
 
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 
+import numpy as np
+import requests
 from neo4j import GraphDatabase
-from langchain_openai import ChatOpenAI
-from .config import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, llm, OPENAI_API_KEY, LLM_MODEL_NAME
+from .config import LLM_MODEL_NAME, NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, NEO4J_HTTP_URL, REDIS_URL, get_llm, get_llm_deterministic, get_embeddings
+from .config import RETRY_MAX_ATTEMPTS, is_rate_limit_error, rate_limited, retry_delay
+
+log = logging.getLogger(__name__)
 
 _driver = None
-llm_deterministic = ChatOpenAI(
-    model=LLM_MODEL_NAME,
-    temperature=0.0,
-    api_key=OPENAI_API_KEY,
-)
+_redis = None
+_redis_checked = False
+
+SCHEMA_STATEMENTS = [
+    # Backs MERGE (:Entity {name}) with an index lookup instead of a label scan
+    "CREATE CONSTRAINT entity_name IF NOT EXISTS FOR (e:Entity) REQUIRE e.name IS UNIQUE",
+    "CREATE INDEX relates_to_doc_pred IF NOT EXISTS FOR ()-[r:RELATES_TO]-() ON (r.doc_id, r.predicate)",
+    # Lower-cased name for the case-insensitive CONTAINS lookups in query_kg_for_query
+    "CREATE TEXT INDEX entity_name_lc IF NOT EXISTS FOR (e:Entity) ON (e.name_lc)",
+    # Backfill name_lc on entities written before it existed
+    "MATCH (e:Entity) WHERE e.name_lc IS NULL SET e.name_lc = toLower(e.name)",
+]
+
+
+def _ensure_schema(driver) -> None:
+    """
+    Create the constraint/index the KG upserts and lookups rely on (idempotent).
+    """
+    with driver.session() as session:
+        for stmt in SCHEMA_STATEMENTS:
+            try:
+                session.run(stmt)
+            except Exception as e:
+                log.warning("Could not apply Neo4j schema statement (%s): %s", stmt, e)
+
 
 def get_driver():
     global _driver
@@ -22,87 +54,379 @@ def get_driver():
             # Test connection
             with _driver.session() as session:
                 session.run("RETURN 1")
-            print("Connected to Neo4j successfully")
+            log.info("Connected to Neo4j successfully")
+            _ensure_schema(_driver)
         except Exception as e:
-            print(f"Warning: Could not connect to Neo4j: {e}")
-            print("Knowledge Graph features will be disabled. Please start Neo4j to enable them.")
+            log.warning("Could not connect to Neo4j: %s", e)
+            log.warning("Knowledge Graph features will be disabled. Please start Neo4j to enable them.")
             _driver = None
     return _driver
 
 
+# ---------- Query cache (Redis, optional) ----------
+
+# Seconds a cached entity list / KG query result stays valid
+KG_CACHE_TTL = 600
+
+
+def get_redis():
+    """
+    Return a Redis client if REDIS_URL is set and reachable, else None
+    (caching is then simply skipped).
+    """
+    global _redis, _redis_checked
+    if not _redis_checked:
+        _redis_checked = True
+        if REDIS_URL:
+            try:
+                import redis
+                _redis = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+                _redis.ping()
+                log.info("Connected to Redis successfully")
+            except Exception as e:
+                log.warning("Could not connect to Redis: %s", e)
+                log.warning("KG query caching will be disabled.")
+                _redis = None
+    return _redis
+
+
+def _cache_key(prefix: str, query: str) -> str:
+    return f"{prefix}:{hashlib.sha256(query.encode('utf-8')).hexdigest()}"
+
+
+def _cache_get(key: str) -> Optional[Any]:
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        raw = r.get(key)
+        return json.loads(raw) if raw is not None else None
+    except Exception as e:
+        log.warning("Redis get failed: %s", e)
+        return None
+
+
+def _cache_set(key: str, value: Any) -> None:
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.setex(key, KG_CACHE_TTL, json.dumps(value, ensure_ascii=False))
+    except Exception as e:
+        log.warning("Redis set failed: %s", e)
+
+
+def _invalidate_kg_query_cache(doc_id: str) -> None:
+    """
+    Drop cached KG query results that may include triples of doc_id.
+    """
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        for pattern in (f"kg:q:{doc_id}:*", "kg:q:_all:*"):
+            keys = list(r.scan_iter(match=pattern))
+            if keys:
+                r.delete(*keys)
+    except Exception as e:
+        log.warning("Redis invalidation failed: %s", e)
+
+
 # ---------- Triple extraction using LLM ----------
 
-TRIPLE_EXTRACTION_SYSTEM = (
+TRIPLE_EXTRACTION_BATCH_SYSTEM = (
     "You are an information extraction assistant. "
-    "Given a passage of text, extract important factual triples "
-    "in the form (subject, predicate, object).\\n"
-    "Rules:\\n"
-    "1. Extract ALL key facts, definitions, and relationships.\\n"
-    "2. Use simple, atomic subjects and objects (e.g. 'The process of photosynthesis' -> 'photosynthesis').\\n"
-    "3. Return them as lines in the format: subject | predicate | object\\n"
-    "4. If you find nothing, return an empty string."
+    "You are given several numbered passages of text ('### CHUNK <i>'). "
+    "For each passage, extract important factual triples "
+    "in the form (subject, predicate, object).\n"
+    "Rules:\n"
+    "1. Extract ALL key facts, definitions, and relationships.\n"
+    "2. Use simple, atomic subjects and objects (e.g. 'The process of photosynthesis' -> 'photosynthesis').\n"
+    "3. Return one triple per line in the format: CHUNK_<i>: subject | predicate | object\n"
+    "   where <i> is the number of the passage the triple comes from.\n"
+    "4. If you find nothing in any passage, return an empty string."
 )
 
 
-def extract_triples_from_text(text: str) -> List[Dict[str, str]]:
+# Max number of triple-extraction LLM calls in flight at once
+KG_EXTRACTION_CONCURRENCY = 8
+
+# Chunks packed into one extraction prompt (bounded by count and total size)
+KG_BATCH_CHUNKS = 8
+KG_BATCH_MAX_CHARS = 6000
+# 'CHUNK_3: s | p | o', or a bare header ('CHUNK_3:', '### CHUNK 3') for the lines below it
+_CHUNK_LINE_RE = re.compile(r"^\s*(?:#+\s*)?CHUNK[_ ]?(\d+)\s*:?\s*(.*)$", re.IGNORECASE)
+
+# One long-lived event loop for the async LLM calls: the cached ChatOpenAI's
+# async HTTP client must not be shared across short-lived asyncio.run() loops.
+_loop = asyncio.new_event_loop()
+_loop_lock = threading.Lock()
+
+
+def _run_async(coro):
+    with _loop_lock:
+        return _loop.run_until_complete(coro)
+
+
+# ---------- Triple cache (SQLite) ----------
+# Extraction is a pure function of the chunk text (for a given model and
+# prompt), so results are kept on disk by hash: re-indexing the same book
+# costs no LLM calls. Changing the model or prompt changes every key.
+
+TRIPLE_CACHE_PATH = "triples_cache.sqlite"
+_triple_cache_conn: Optional[sqlite3.Connection] = None
+_triple_cache_lock = threading.Lock()
+
+
+def _triple_cache_db() -> sqlite3.Connection:
+    global _triple_cache_conn
+    if _triple_cache_conn is None:
+        _triple_cache_conn = sqlite3.connect(TRIPLE_CACHE_PATH, check_same_thread=False)
+        _triple_cache_conn.execute(
+            "CREATE TABLE IF NOT EXISTS triples (hash TEXT PRIMARY KEY, triples_json TEXT)"
+        )
+        _triple_cache_conn.commit()
+    return _triple_cache_conn
+
+
+_TRIPLE_CACHE_VERSION = hashlib.sha1(
+    f"{LLM_MODEL_NAME}\0{TRIPLE_EXTRACTION_BATCH_SYSTEM}".encode("utf-8")
+).hexdigest()[:12]
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(f"{_TRIPLE_CACHE_VERSION}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _triple_cache_get(text: str) -> Optional[List[Dict[str, str]]]:
+    with _triple_cache_lock:
+        row = _triple_cache_db().execute(
+            "SELECT triples_json FROM triples WHERE hash = ?", (_text_hash(text),)
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _triple_cache_put(items: Dict[str, List[Dict[str, str]]]) -> None:
+    rows = [(_text_hash(t), json.dumps(triples, ensure_ascii=False)) for t, triples in items.items()]
+    if not rows:
+        return
+    with _triple_cache_lock:
+        db = _triple_cache_db()
+        db.executemany("INSERT OR REPLACE INTO triples (hash, triples_json) VALUES (?, ?)", rows)
+        db.commit()
+
+
+def _parse_triples(content: str) -> List[Dict[str, str]]:
     """
-    Use the LLM to extract subject–predicate–object triples from text.
+    Parse 'subject | predicate | object' lines from an LLM response.
     """
-    if not text.strip():
-        return []
+    triples: List[Dict[str, str]] = []
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or "|" not in line:
+            continue
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) != 3:
+            continue
+        s, p, o = parts
+        # Validate that we have non-empty values
+        if s and p and o:
+            triples.append({"s": s, "p": p, "o": o})
+    return triples
 
-    prompt = (
-        "Extract factual triples from the following text.\\n\\n"
-        f"TEXT:\\n{text}\\n\\n"
-        "TRIPLES (one per line, 'subject | predicate | object'):"
-    )
 
-    msg = [
-        ("system", TRIPLE_EXTRACTION_SYSTEM),
-        ("user", prompt),
-    ]
-    
-    # Robust retry logic with backoff
-    max_retries = 12
+async def _ainvoke_with_retry(msg) -> Optional[str]:
+    """
+    Call the LLM with backoff on rate limits.
+    Returns the stripped response text, or None if every attempt failed.
+    """
+    # Robust retry logic with jittered backoff
+    max_retries = RETRY_MAX_ATTEMPTS
     for attempt in range(max_retries):
         try:
-            response = llm.invoke(msg)
-            content = response.content.strip()
-
-            triples: List[Dict[str, str]] = []
-            for line in content.splitlines():
-                line = line.strip()
-                if not line or "|" not in line:
-                    continue
-                parts = [p.strip() for p in line.split("|")]
-                if len(parts) != 3:
-                    continue
-                s, p, o = parts
-                # Validate that we have non-empty values
-                if s and p and o:
-                    triples.append({"s": s, "p": p, "o": o})
-            return triples
+            response = await rate_limited(get_llm().ainvoke)(msg)
+            return response.content.strip()
             
         except Exception as e:
-            err_str = str(e).lower()
-            # Check for rate limit (429 or 'rate_limit')
-            if ("429" in err_str or "rate_limit" in err_str) and attempt < max_retries - 1:
-                wait_time = (2 ** attempt) + 2  # 3s, 4s, 6s, 10s...
-                print(f"KG Rate limit hit. Retrying in {wait_time}s...")
-                import time
-                time.sleep(wait_time)
+            if is_rate_limit_error(e) and attempt < max_retries - 1:
+                wait_time = retry_delay(e, attempt)
+                log.info("KG rate limit hit. Retrying in %.1fs...", wait_time)
+                await asyncio.sleep(wait_time)
                 continue
             else:
-                print(f"Error extracting triples (attempt {attempt + 1}/{max_retries}): {e}")
+                log.error("Error extracting triples (attempt %d/%d): %s", attempt + 1, max_retries, e)
                 if attempt == max_retries - 1:
                     # Last attempt failed
-                    print(f"Failed to extract triples after {max_retries} attempts")
-                return []
-    return []
+                    log.error("Failed to extract triples after %d attempts", max_retries)
+                return None
+    return None
+
+
+async def aextract_triples_batched(texts: List[str]) -> Optional[List[List[Dict[str, str]]]]:
+    """
+    Extract triples for several texts with a single LLM call.
+    The texts are sent as numbered '### CHUNK i' sections and the model
+    answers with 'CHUNK_i: subject | predicate | object' lines, which are
+    routed back to their text. Unprefixed triple lines are assigned to the
+    most recent chunk header. Returns one triple list per input text, or None
+    if the LLM call failed or a non-empty reply yielded no parsable triples.
+    """
+    results: List[List[Dict[str, str]]] = [[] for _ in texts]
+    if not any(t.strip() for t in texts):
+        return results
+
+    sections = "\n\n".join(f"### CHUNK {i}\n{t}" for i, t in enumerate(texts))
+    prompt = (
+        "Extract factual triples from each of the following numbered texts.\n\n"
+        f"{sections}\n\n"
+        "TRIPLES (one per line, prefixed with the chunk number they come from, "
+        "'CHUNK_<i>: subject | predicate | object'):"
+    )
+
+    msg = [
+        ("system", TRIPLE_EXTRACTION_BATCH_SYSTEM),
+        ("user", prompt),
+    ]
+
+    content = await _ainvoke_with_retry(msg)
+    if content is None:
+        return None
+
+    # A single-text batch needs no routing, even if the model drops the prefix
+    current: Optional[int] = 0 if len(texts) == 1 else None
+    parsed = 0
+    for line in content.splitlines():
+        m = _CHUNK_LINE_RE.match(line)
+        if m:
+            current = int(m.group(1))
+            line = m.group(2)
+        if current is None or current >= len(results):
+            continue
+        triples = _parse_triples(line)
+        results[current].extend(triples)
+        parsed += len(triples)
+
+    if content and not parsed:
+        # The model answered but not in a format we could route: a failure,
+        # not "no triples" (so nothing gets cached for these texts)
+        log.warning("Could not parse batched triple reply (%d chunks): %.200r", len(texts), content)
+        return None
+    return results
+
+
+def _batch_texts(texts: List[str]) -> List[List[str]]:
+    """
+    Group texts into windows of at most KG_BATCH_CHUNKS texts and
+    KG_BATCH_MAX_CHARS characters (a single oversized text gets its own window).
+    """
+    batches: List[List[str]] = []
+    current: List[str] = []
+    current_chars = 0
+    for t in texts:
+        if current and (len(current) >= KG_BATCH_CHUNKS or current_chars + len(t) > KG_BATCH_MAX_CHARS):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(t)
+        current_chars += len(t)
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _aextract_triples_for_texts(texts: List[str]) -> List[List[Dict[str, str]]]:
+    """
+    Extract triples for all texts. Texts already in the triple cache are
+    answered from it; the rest are packed into multi-chunk prompts and the
+    batches run concurrently, with at most KG_EXTRACTION_CONCURRENCY requests
+    in flight. A failing batch yields [] for each of its texts; empty
+    results are never cached.
+    """
+    unique = list(dict.fromkeys(texts))
+    results: Dict[str, List[Dict[str, str]]] = {}
+    for t in unique:
+        cached = _triple_cache_get(t)
+        if cached is not None:
+            results[t] = cached
+    missing = [t for t in unique if t not in results]
+    if results:
+        log.debug("Triple cache hits: %d/%d chunks", len(results), len(unique))
+
+    sem = asyncio.Semaphore(KG_EXTRACTION_CONCURRENCY)
+
+    async def bounded(batch: List[str]) -> None:
+        async with sem:
+            try:
+                extracted = await aextract_triples_batched(batch)
+            except Exception as e:
+                log.error("Error extracting triples: %s", e)
+                extracted = None
+        if extracted is None:
+            return
+        fresh = dict(zip(batch, extracted))
+        results.update(fresh)
+        # Only cache texts that got triples: an empty list may just mean the
+        # model skipped that chunk, and caching it would hide it for good
+        _triple_cache_put({t: triples for t, triples in fresh.items() if triples})
+
+    await asyncio.gather(*(bounded(b) for b in _batch_texts(missing)))
+    return [results.get(t, []) for t in texts]
+
+
+def extract_triples_from_text(text: str) -> List[Dict[str, str]]:
+    """
+    Use the LLM to extract subject–predicate–object triples from text.
+    Sync wrapper over the cached, batched extraction path.
+    """
+    return _run_async(_aextract_triples_for_texts([text]))[0]
 
 
 # ---------- Upsert into Neo4j ----------
 
+KG_UPSERT_BATCH_SIZE = 500
+KG_HTTP_WORKERS = 4
+
+# Two passes per batch: merge the distinct entity names first, then the
+# edges between them (both are index lookups thanks to SCHEMA_STATEMENTS)
+UPSERT_NODES_CYPHER = """
+UNWIND $names AS name
+MERGE (e:Entity {name: name})
+SET e.name_lc = toLower(name)
+"""
+
+UPSERT_EDGES_CYPHER = """
+UNWIND $triples AS t
+MATCH (s:Entity {name: t.s})
+MATCH (o:Entity {name: t.o})
+MERGE (s)-[r:RELATES_TO {predicate: t.p, doc_id: $doc_id}]->(o)
+"""
+
+
+def _entity_names(batch: List[Dict[str, str]]) -> List[str]:
+    # Sorted so concurrent transactions lock nodes in the same order
+    return sorted({t["s"] for t in batch} | {t["o"] for t in batch})
+
+
+def _http_commit(batch: List[Dict[str, str]], doc_id: str) -> None:
+    """
+    Upsert one batch through Neo4j's HTTP transactional endpoint
+    (both passes, begin + commit in a single request).
+    """
+    statements = [
+        {"statement": UPSERT_NODES_CYPHER, "parameters": {"names": _entity_names(batch)}},
+        {"statement": UPSERT_EDGES_CYPHER, "parameters": {"triples": batch, "doc_id": doc_id}},
+    ]
+    resp = requests.post(
+        f"{NEO4J_HTTP_URL.rstrip('/')}/db/neo4j/tx/commit",
+        json={"statements": statements},
+        auth=(NEO4J_USER, NEO4J_PASSWORD),
+        timeout=120,
+    )
+    resp.raise_for_status()
+    errors = resp.json().get("errors")
+    if errors:
+        raise RuntimeError(f"Neo4j HTTP commit failed: {errors}")
+
+
 def upsert_kg_from_chunks(chunks, doc_id: str) -> None:
     """
     Given LangChain Document chunks, extract triples and upsert them into Neo4j.
@@ -111,7 +435,7 @@ def upsert_kg_from_chunks(chunks, doc_id: str) -> None:
     
     # Check if Neo4j is available
     if driver is None:
-        print("⚠️ Neo4j is not available - skipping knowledge graph extraction")
+        log.warning("Neo4j is not available - skipping knowledge graph extraction")
         return
 
     all_triples: List[Dict[str, str]] = []
@@ -120,38 +444,48 @@ def upsert_kg_from_chunks(chunks, doc_id: str) -> None:
     # Previously was 20% coverage [::5] which missed too many details.
     chunks_to_process = chunks[::2]
     
-    print(f"Building KG from {len(chunks_to_process)} chunks (sampled from {len(chunks)})...")
+    log.info("Building KG from %d chunks (sampled from %d)...", len(chunks_to_process), len(chunks))
     
-    for ch in chunks_to_process:
-        text = ch.page_content
-        # skip very short chunks
-        if len(text) < 100:
-            continue
-        triples = extract_triples_from_text(text)
+    # skip very short chunks
+    texts = [ch.page_content for ch in chunks_to_process if len(ch.page_content) >= 100]
+    for triples in _run_async(_aextract_triples_for_texts(texts)):
         all_triples.extend(triples)
-        
-        # Small delay to be nice to the API
-        import time
-        time.sleep(1.0)
 
     if not all_triples:
-        print("No triples extracted from chunks.")
+        log.info("No triples extracted from chunks.")
         return
 
+    # Drop duplicate facts (case-insensitive) before they cost MERGE work
+    seen = set()
+    unique_triples: List[Dict[str, str]] = []
+    for t in all_triples:
+        key = (t["s"].lower(), t["p"].lower(), t["o"].lower())
+        if key not in seen:
+            seen.add(key)
+            unique_triples.append(t)
+    if len(unique_triples) < len(all_triples):
+        log.debug("Removed %d duplicate triples (%d unique)", len(all_triples) - len(unique_triples), len(unique_triples))
+    all_triples = unique_triples
+
     # Upload triples in batches to avoid Neo4j transaction timeouts
-    BATCH_SIZE = 500
-    cypher = """
-    UNWIND $triples AS t
-    MERGE (s:Entity {name: t.s})
-    MERGE (o:Entity {name: t.o})
-    MERGE (s)-[r:RELATES_TO {predicate: t.p, doc_id: $doc_id}]->(o)
-    """
+    batches = [all_triples[i:i + KG_UPSERT_BATCH_SIZE] for i in range(0, len(all_triples), KG_UPSERT_BATCH_SIZE)]
 
-    with driver.session() as session:
-        for i in range(0, len(all_triples), BATCH_SIZE):
-            batch = all_triples[i:i + BATCH_SIZE]
-            session.run(cypher, triples=batch, doc_id=doc_id)
-            print(f"Uploaded KG batch {i // BATCH_SIZE + 1} ({len(batch)} triples)")
+    if NEO4J_HTTP_URL:
+        # Bulk path: one HTTP transactional commit per batch, several in flight
+        with ThreadPoolExecutor(max_workers=KG_HTTP_WORKERS) as ex:
+            futs = [ex.submit(_http_commit, batch, doc_id) for batch in batches]
+            for n, (fut, batch) in enumerate(zip(futs, batches), start=1):
+                fut.result()
+                log.debug("Uploaded KG batch %d (%d triples)", n, len(batch))
+    else:
+        with driver.session() as session:
+            for n, batch in enumerate(batches, start=1):
+                session.run(UPSERT_NODES_CYPHER, names=_entity_names(batch))
+                session.run(UPSERT_EDGES_CYPHER, triples=batch, doc_id=doc_id)
+                log.debug("Uploaded KG batch %d (%d triples)", n, len(batch))
+
+    # The graph for this document changed: cached query results are stale
+    _invalidate_kg_query_cache(doc_id)
 
 
 # ---------- Entity Extraction for Query Filtering ----------
@@ -170,13 +504,19 @@ ENTITY_EXTRACTION_SYSTEM = (
     "8. If the query is conversational or has no specific entities, return an empty string."
 )
 
-def extract_entities_from_query(query: str) -> List[str]:
+def extract_entities_from_query(query: str, raise_errors: bool = False) -> List[str]:
     """
     Extract key entities from the user query to filter KG results.
     Uses deterministic LLM (temp=0) for stability.
+    LLM errors give [] unless raise_errors is set.
     """
     if not query.strip():
         return []
+    
+    cache_key = _cache_key("kg:ent", query)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
         
     msg = [
         ("system", ENTITY_EXTRACTION_SYSTEM),
@@ -185,7 +525,7 @@ def extract_entities_from_query(query: str) -> List[str]:
     
     try:
         # Use deterministic LLM
-        response = llm_deterministic.invoke(msg)
+        response = rate_limited(get_llm_deterministic().invoke)(msg)
         content = response.content.strip()
         
         if not content:
@@ -193,14 +533,72 @@ def extract_entities_from_query(query: str) -> List[str]:
             
         # Split by pipe and clean
         entities = [e.strip() for e in content.split("|") if e.strip()]
+        _cache_set(cache_key, entities)
         return entities
         
     except Exception as e:
-        print(f"Error extracting entities from query: {e}")
+        if raise_errors:
+            raise
+        log.error("Error extracting entities from query: %s", e)
+        return []
+
+
+# Relevance filtering: embedding similarity by default (no extra LLM round-trip);
+# set USE_LLM_RELEVANCE_FILTER to compare against the old LLM-based filter.
+USE_LLM_RELEVANCE_FILTER = False
+KG_RELEVANCE_TOP_K = 20
+KG_RELEVANCE_MIN_SIM = 0.5
+# Kept (best-scoring first) when nothing clears KG_RELEVANCE_MIN_SIM
+KG_RELEVANCE_FALLBACK_K = 10
+
+# Triple indices in the LLM filter's reply ("0, 2, 5")
+_INT_RE = re.compile(r"\d+")
+
+
+def filter_relevant_triples(
+    query: str, triples: List[Dict[str, Any]], raise_errors: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Filter out triples that are not semantically relevant to the query.
+    This prevents 'keyword matching' hallucinations.
+    Scores each 's p o' string by cosine similarity to the query embedding and
+    keeps the top KG_RELEVANCE_TOP_K above KG_RELEVANCE_MIN_SIM, or the best
+    KG_RELEVANCE_FALLBACK_K if none clears the threshold.
+    If scoring fails, all triples are returned unless raise_errors is set.
+    """
+    if USE_LLM_RELEVANCE_FILTER:
+        return filter_relevant_triples_llm(query, triples, raise_errors)
+    if not triples:
         return []
+    
+    try:
+        # One embeddings call for the query and all triples
+        texts = [query] + [f"{t['s']} {t['p']} {t['o']}" for t in triples]
+        vecs = np.asarray(get_embeddings().embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs /= np.maximum(norms, 1e-12)
+        
+        sims = vecs[1:] @ vecs[0]
+        order = np.argsort(-sims)
+        kept = [triples[i] for i in order[:KG_RELEVANCE_TOP_K] if sims[i] >= KG_RELEVANCE_MIN_SIM]
+        if not kept:
+            # Short triples often score below the threshold against a full
+            # question; the ranking is still better than arbitrary rows
+            log.debug("No triple reached similarity %.2f (best %.2f); keeping top %d",
+                      KG_RELEVANCE_MIN_SIM, float(sims[order[0]]), KG_RELEVANCE_FALLBACK_K)
+            kept = [triples[i] for i in order[:KG_RELEVANCE_FALLBACK_K]]
+        return kept
+        
+    except Exception as e:
+        if raise_errors:
+            raise
+        log.error("Error filtering triples: %s", e)
+        return triples  # Fallback: return all if filter fails
 
 
-def filter_relevant_triples(query: str, triples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def filter_relevant_triples_llm(
+    query: str, triples: List[Dict[str, Any]], raise_errors: bool = False
+) -> List[Dict[str, Any]]:
     """
     Use LLM to filter out triples that are not semantically relevant to the query.
     This prevents 'keyword matching' hallucinations.
@@ -228,91 +626,124 @@ def filter_relevant_triples(query: str, triples: List[Dict[str, Any]]) -> List[D
     ]
     
     try:
-        response = llm_deterministic.invoke(msg)
+        response = rate_limited(get_llm_deterministic().invoke)(msg)
         content = response.content.strip()
         
         if "NONE" in content:
             return []
             
         # Parse numbers
-        indices = []
-        for part in content.split(","):
-            part = part.strip()
-            if part.isdigit():
-                indices.append(int(part))
-                
-        filtered = [triples[i] for i in indices if i < len(triples)]
-        return filtered
+        n = len(triples)
+        indices = [i for i in map(int, _INT_RE.findall(content)) if i < n]
+        return [triples[i] for i in indices]
         
     except Exception as e:
-        print(f"Error filtering triples: {e}")
+        if raise_errors:
+            raise
+        log.error("Error filtering triples: %s", e)
         return triples  # Fallback: return all if filter fails
 
 
+def _read_rows(driver, cypher: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Run a read query in a managed read transaction and fetch all rows at once.
+    Result.data() drains the stream in one call instead of converting record by record.
+    """
+    with driver.session() as session:
+        return session.execute_read(lambda tx: tx.run(cypher, **params).data())
+
+
 def query_kg_for_query(query: str, doc_id: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Query the knowledge graph - returns ONLY triples relevant to the query entities.
+    Costs one LLM call (entity extraction) plus one embeddings call for the relevance filter.
+    Results are cached in Redis (when configured) for KG_CACHE_TTL seconds.
+    """
+    cache_key = _cache_key(f"kg:q:{doc_id or '_all'}", query)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        log.debug("KG query cache hit (%d triples)", len(cached))
+        return cached
+    
+    rows, cacheable = _query_kg_uncached(query, doc_id)
+    
+    # Don't cache degraded answers (Neo4j down, LLM/embeddings errors):
+    # a transient failure shouldn't stick for KG_CACHE_TTL
+    if cacheable:
+        _cache_set(cache_key, rows)
+    return rows
+
+
+def _query_kg_uncached(query: str, doc_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Returns (rows, cacheable); cacheable is False when a step failed and the
+    rows are a fallback.
     """
     driver = get_driver()
     
     # Check if Neo4j is available
     if driver is None:
-        print("Neo4j is not available - returning empty results")
-        return []
+        log.warning("Neo4j is not available - returning empty results")
+        return [], False
         
     # 1. Extract entities from the query
-    entities = extract_entities_from_query(query)
-    print(f"Extracted entities for KG query: {entities}")
+    try:
+        entities = extract_entities_from_query(query, raise_errors=True)
+    except Exception as e:
+        log.error("Error extracting entities from query: %s", e)
+        return [], False
+    log.debug("Extracted entities for KG query: %s", entities)
     
     if not entities:
-        print("No entities found in query - skipping KG lookup")
-        return []
+        log.info("No entities found in query - skipping KG lookup")
+        return [], True
     
     # 2. Query for triples involving these entities (fuzzy match)
-    # We use case-insensitive substring matching for broader recall
+    # Case-insensitive substring matching on the pre-lowercased name_lc
+    # property, so Neo4j doesn't lowercase every node name per query.
+    # Synonym expansion often repeats a term in another case ('Flight | flight'),
+    # so drop duplicates once lowercased: each one is an extra CONTAINS per edge.
+    entities_lc = list(dict.fromkeys(e.lower() for e in entities))
     if doc_id:
         cypher = """
         MATCH (s:Entity)-[r:RELATES_TO]->(o:Entity)
         WHERE r.doc_id = $doc_id
-        AND (
-            any(e IN $entities WHERE toLower(s.name) CONTAINS toLower(e)) OR 
-            any(e IN $entities WHERE toLower(o.name) CONTAINS toLower(e))
-        )
+        AND any(e IN $entities WHERE s.name_lc CONTAINS e OR o.name_lc CONTAINS e)
         RETURN s.name AS s, r.predicate AS p, o.name AS o
         LIMIT 50
         """
-        params = {"doc_id": doc_id, "entities": entities}
+        params = {"doc_id": doc_id, "entities": entities_lc}
     else:
         cypher = """
         MATCH (s:Entity)-[r:RELATES_TO]->(o:Entity)
-        WHERE (
-            any(e IN $entities WHERE toLower(s.name) CONTAINS toLower(e)) OR 
-            any(e IN $entities WHERE toLower(o.name) CONTAINS toLower(e))
-        )
+        WHERE any(e IN $entities WHERE s.name_lc CONTAINS e OR o.name_lc CONTAINS e)
         RETURN s.name AS s, r.predicate AS p, o.name AS o
         LIMIT 50
         """
-        params = {"entities": entities}
+        params = {"entities": entities_lc}
     
-    with driver.session() as session:
-        result = session.run(cypher, **params)
-        rows = [r.data() for r in result]
+    rows = _read_rows(driver, cypher, params)
     
     if not rows:
-        print(f"No matching triples found for entities: {entities}")
-        return []
+        log.info("No matching triples found for entities: %s", entities)
+        return [], True
     
-    print(f"Found {len(rows)} candidate triples. Filtering for relevance...")
+    log.debug("Found %d candidate triples. Filtering for relevance...", len(rows))
     
-    # 3. Filter for semantic relevance
-    relevant_rows = filter_relevant_triples(query, rows)
+    # 3. Filter for semantic relevance (embedding scores, no second LLM round-trip)
+    try:
+        relevant_rows = filter_relevant_triples(query, rows, raise_errors=True)
+    except Exception as e:
+        log.error("Error filtering triples: %s; using unfiltered candidates", e)
+        return rows, False
     
     if not relevant_rows:
-        print("Relevance filter removed all triples. Falling back to top 10 candidates.")
-        return rows[:10]
+        # Only the LLM filter can come back empty here
+        log.info("Relevance filter removed all triples. Falling back to top 10 candidates.")
+        return rows[:10], True
     
-    print(f"Found {len(relevant_rows)} relevant triples after filtering (from {len(rows)})")
-    return relevant_rows
+    log.info("Found %d relevant triples after filtering (from %d)", len(relevant_rows), len(rows))
+    return relevant_rows, True
 
 def get_random_triples(doc_id: Optional[str]) -> List[Dict[str, Any]]:
     """
@@ -338,6 +769,4 @@ def get_random_triples(doc_id: Optional[str]) -> List[Dict[str, Any]]:
         """
         params = {}
         
-    with driver.session() as session:
-        result = session.run(cypher, **params)
-        return [r.data() for r in result]
+    return _read_rows(driver, cypher, params)
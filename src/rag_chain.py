@@ -1,10 +1,11 @@
 # src/rag_chain.py
+from functools import lru_cache
 from typing import List, Tuple, Set, Dict, Union, Any
 
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 
-from .config import llm
+from .config import get_llm, rate_limited
 from .vector_store import get_vector_store
 
 # Simple in-memory history for the session
@@ -28,78 +29,51 @@ def get_history_summary(limit: int = 6) -> str:
     return "\n".join(lines)
 
 
+# doc_id -> retriever, so each chat turn reuses the one built for its document
+_retrievers: Dict[str, Any] = {}
+
+
 def get_retriever_for_doc(doc_id: str):
     """
     Build a retriever that only searches chunks belonging to this doc_id.
     """
-    store = get_vector_store()
-    retriever = store.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": 8, "filter": {"doc_id": doc_id}},
-    )
+    retriever = _retrievers.get(doc_id)
+    if retriever is None:
+        store = get_vector_store()
+        retriever = store.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": 8, "filter": {"doc_id": doc_id}},
+        )
+        _retrievers[doc_id] = retriever
     return retriever
 
 
-def format_docs(docs: List[Document]) -> str:
+@lru_cache(maxsize=128)
+def _format_doc_set(items: Tuple[Tuple[Any, str, str], ...]) -> str:
     parts = []
-    for d in docs:
-        page = d.metadata.get("page")
-        source_type = d.metadata.get("type", "text")
+    for page, source_type, content in items:
+        text = content.strip()
+        if not text:
+            continue  # whitespace-only chunks add nothing but a page prefix
         prefix = f"[page {page} ({source_type})] " if page is not None else ""
-        parts.append(prefix + d.page_content.strip())
+        parts.append(prefix + text)
     return "\n\n".join(parts)
 
 
-# src/rag_chain.py
-from typing import List, Tuple, Set, Dict
-
-from langchain_core.documents import Document
-from langchain_core.prompts import ChatPromptTemplate
-
-from .config import llm
-from .vector_store import get_vector_store
-
-# Simple in-memory history for the session
-# List of {"role": "user" | "assistant", "content": "..."}
-message_history: List[Dict[str, str]] = []
-
-def get_history_summary(limit: int = 6) -> str:
-    """
-    Return the last few turns of conversation as a string.
-    """
-    if not message_history:
-        return ""
-    
-    recent = message_history[-limit:]
-    lines = []
-    for msg in recent:
-        role = msg.get("role", "user")
-        content = msg.get("content", "")
-        lines.append(f"{role.upper()}: {content}")
-        
-    return "\n".join(lines)
-
-
-def get_retriever_for_doc(doc_id: str):
+def format_docs(docs: List[Document]) -> str:
     """
-    Build a retriever that only searches chunks belonging to this doc_id.
+    Join retrieved chunks into the context string.
+    Cached per (page, type, content) set, so repeated top-k results aren't rebuilt.
     """
-    store = get_vector_store()
-    retriever = store.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": 8, "filter": {"doc_id": doc_id}},
+    items = tuple(
+        (d.metadata.get("page"), d.metadata.get("type", "text"), d.page_content)
+        for d in docs
     )
-    return retriever
-
-
-def format_docs(docs: List[Document]) -> str:
-    parts = []
-    for d in docs:
-        page = d.metadata.get("page")
-        source_type = d.metadata.get("type", "text")
-        prefix = f"[page {page} ({source_type})] " if page is not None else ""
-        parts.append(prefix + d.page_content.strip())
-    return "\n\n".join(parts)
+    try:
+        return _format_doc_set(items)
+    except TypeError:
+        # Unhashable page metadata; format without the cache
+        return _format_doc_set.__wrapped__(items)
 
 
 RAG_PROMPT = ChatPromptTemplate.from_messages(
@@ -192,7 +166,7 @@ def generate_answer_with_validation(
         answer_lang=answer_lang,
     )
 
-    response = llm.invoke(msgs)
+    response = rate_limited(get_llm().invoke)(msgs)
     answer = response.content.strip()
     
     # Check if the LLM itself said it doesn't know or question is unrelated
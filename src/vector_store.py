@@ -1,48 +1,128 @@
 # src/vector_store.py
+import csv
+import io
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List
 
+import psycopg2
 from langchain_community.vectorstores.pgvector import PGVector
 from langchain_core.documents import Document
 
-from .config import NEON_DB_URL, embeddings
+from .config import NEON_DB_URL, get_embeddings
 
+log = logging.getLogger(__name__)
 
 COLLECTION_NAME = "book_chunks"
 
+# Parallel embedding calls in add_chunks (each one is mostly embedding RTT)
+ADD_WORKERS = 8
+
+# Bulk-load embeddings with COPY instead of PGVector's per-row INSERTs
+USE_COPY_INSERT = True
+
 
 def init_pgvector_collection() -> None:
     """
     Touch the collection once so PGVector creates the extension / table if needed.
     The warning about deprecation is okay for now.
     """
-    _ = PGVector(
-        connection_string=NEON_DB_URL,
-        collection_name=COLLECTION_NAME,
-        embedding_function=embeddings,
-    )
+    get_vector_store()
 
 
+@lru_cache(maxsize=1)
 def get_vector_store() -> PGVector:
     """
-    Return a PGVector instance bound to our Neon database.
+    Return the shared PGVector instance bound to our Neon database.
+    Cached so every caller reuses one SQLAlchemy engine / connection pool.
     """
     store = PGVector(
         connection_string=NEON_DB_URL,
         collection_name=COLLECTION_NAME,
-        embedding_function=embeddings,
+        embedding_function=get_embeddings(),
+        engine_args={"pool_pre_ping": True, "pool_size": 10},
     )
     return store
 
 
+def _raw_connection():
+    """
+    psycopg2 connection checked out of the store's pooled SQLAlchemy engine
+    (PGVector keeps it in _bind); close() hands it back to the pool.
+    """
+    return get_vector_store()._bind.raw_connection()
+
+
+def _embed_batch(batch: List[Document]) -> List[List[float]]:
+    return get_embeddings().embed_documents([d.page_content for d in batch])
+
+
+def _copy_rows(cur, collection_id: str, batch: List[Document], vectors: List[List[float]]) -> None:
+    """
+    Stream one batch into langchain_pg_embedding with COPY ... FROM STDIN (CSV).
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for doc, vec in zip(batch, vectors):
+        row_id = str(uuid.uuid4())
+        writer.writerow([
+            row_id,
+            collection_id,
+            "[" + ",".join(map(str, vec)) + "]",
+            doc.page_content,
+            json.dumps(doc.metadata, default=str),
+            row_id,
+        ])
+    buf.seek(0)
+    cur.copy_expert(
+        "COPY langchain_pg_embedding (uuid, collection_id, embedding, document, cmetadata, custom_id) "
+        "FROM STDIN WITH (FORMAT csv)",
+        buf,
+    )
+
+
 def add_chunks(chunks: List[Document]) -> None:
     """
     Add chunked Documents to PGVector in batches.
+    Batches are embedded in parallel and bulk-loaded with COPY on one pooled connection.
     """
     store = get_vector_store()
     
     # Batch size of 100 to avoid huge payloads/timeouts
     batch_size = 100
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i : i + batch_size]
-        store.add_documents(batch)
-        print(f"Added batch {i // batch_size + 1} ({len(batch)} chunks)")
+    batches = [chunks[i : i + batch_size] for i in range(0, len(chunks), batch_size)]
+    if not batches:
+        return
+    
+    if not USE_COPY_INSERT:
+        with ThreadPoolExecutor(max_workers=ADD_WORKERS) as ex:
+            for n, (_, batch) in enumerate(zip(ex.map(store.add_documents, batches), batches), start=1):
+                log.debug("Added batch %d (%d chunks)", n, len(batch))
+        return
+    
+    conn = _raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT uuid FROM langchain_pg_collection WHERE name = %s", (COLLECTION_NAME,))
+            collection_id = str(cur.fetchone()[0])
+        
+        with ThreadPoolExecutor(max_workers=ADD_WORKERS) as ex:
+            for n, (vectors, batch) in enumerate(zip(ex.map(_embed_batch, batches), batches), start=1):
+                try:
+                    with conn.cursor() as cur:
+                        _copy_rows(cur, collection_id, batch, vectors)
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    log.warning("COPY failed for batch %d (%s); falling back to add_embeddings", n, e)
+                    store.add_embeddings(
+                        texts=[d.page_content for d in batch],
+                        embeddings=vectors,
+                        metadatas=[d.metadata for d in batch],
+                    )
+                log.debug("Added batch %d (%d chunks)", n, len(batch))
+    finally:
+        conn.close()
@@ -1,9 +1,34 @@
 # stock_price_scraper_tatapower.py
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+import os
 import re
+import sys
+
+import requests
+
+# Playwright is only needed for the --browser fallback, so it's imported lazily
 
 TICKER = "TATAPOWER:NSE"  # Tata Power (India)
 FINANCE_URL = f"https://www.google.com/finance/quote/{TICKER}?hl=en"
+HEADLESS = True  # set False to watch the browser
+
+# Cookies (incl. the consent choice) are saved here and loaded on the next run
+STATE_PATH = "state.json"
+# Only the DOM text is needed: don't download images, fonts or stylesheets
+BLOCK_PATTERN = "**/*.{png,jpg,jpeg,gif,svg,webp,css,woff,woff2}"
+PRICE_SELECTORS = ["div.YMlKec.fxKbKc", "div.YMlKec", "main"]
+PRICE_RE = re.compile(r"₹\s?([\d,]+(?:\.\d+)?)")
+# The quote page's server-rendered HTML carries the price in this attribute
+LAST_PRICE_RE = re.compile(r'data-last-price="([\d.]+)"')
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept-Language": "en-IN,en;q=0.9",
+}
+
+# Kept open between run_scraper() calls so repeat scrapes skip the browser cold start
+_pw = None
+_browser = None
+_context = None
 
 def accept_consent(page):
     # Try common consent buttons (page & iframes); ignore if not present.
@@ -25,33 +50,86 @@ def accept_consent(page):
             frame.locator("button:has-text('I agree'), button:has-text('Accept all'), button:has-text('Accept')").first.click(timeout=1500); return
         except: pass
 
+def get_price_via_http():
+    # One GET instead of a browser; None if the page didn't carry the price
+    try:
+        r = requests.get(FINANCE_URL, headers=HTTP_HEADERS, timeout=15)
+        r.raise_for_status()
+    except requests.RequestException as e:
+        print(f"HTTP fetch failed: {e}")
+        return None
+    m = LAST_PRICE_RE.search(r.text)
+    return f"₹{float(m.group(1)):,.2f}" if m else None
+
 def get_price_on_finance(page):
+    from playwright.sync_api import TimeoutError as PWTimeout
     # Primary: stable Google Finance price selector
-    price = page.locator("div.YMlKec.fxKbKc").first
+    price = page.locator(PRICE_SELECTORS[0]).first
     try:
         price.wait_for(timeout=8000)
         return price.inner_text().strip()  # e.g., ₹372.45
     except PWTimeout:
-        # Fallback: first rupee-looking number
-        m = re.search(r"₹\s?([\d,]+(?:\.\d+)?)", page.content())
-        return f"₹{m.group(1)}" if m else None
+        pass
+    # Fallback: first rupee-looking number in the candidate elements' text
+    # (inner_text only, instead of pulling the whole page HTML)
+    for sel in PRICE_SELECTORS[1:]:
+        try:
+            m = PRICE_RE.search(page.locator(sel).first.inner_text(timeout=2000))
+        except PWTimeout:
+            continue
+        if m:
+            return f"₹{m.group(1)}"
+    return None
 
-def main():
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)   # set True to hide the browser
-        context = browser.new_context(locale="en-IN") # INR formatting
-        page = context.new_page()
+def _get_context():
+    global _pw, _browser, _context
+    if _context is None:
+        from playwright.sync_api import sync_playwright
+        _pw = sync_playwright().start()
+        _browser = _pw.chromium.launch(headless=HEADLESS)
+        _context = _browser.new_context(
+            locale="en-IN",  # INR formatting
+            storage_state=STATE_PATH if os.path.exists(STATE_PATH) else None,
+        )
+        _context.route(BLOCK_PATTERN, lambda route: route.abort())
+    return _context
 
-        page.goto(FINANCE_URL, timeout=60000)
-        accept_consent(page)
+def close_scraper():
+    global _pw, _browser, _context
+    if _context is not None:
+        _browser.close()
+        _pw.stop()
+        _pw = _browser = _context = None
 
-        price = get_price_on_finance(page)
-        if price:
-            print(f"\n✅ Tata Power (NSE) Stock Price: {price}\n")
-        else:
-            print("\n❌ Could not locate the price. UI may have changed.\n")
+def scrape(page, first_run=False):
+    page.goto(FINANCE_URL, timeout=60000)
+    if first_run:
+        accept_consent(page)  # later runs reuse the saved consent cookie
+    return get_price_on_finance(page)
 
-        browser.close()
+def run_scraper(persistent=True):
+    """Scrape the price once; with persistent=True the browser stays open for the next call."""
+    first_run = not os.path.exists(STATE_PATH)
+    context = _get_context()
+    page = context.new_page()
+    try:
+        price = scrape(page, first_run=first_run)
+        context.storage_state(path=STATE_PATH)
+    finally:
+        page.close()
+        if not persistent:
+            close_scraper()
+    return price
+
+def main():
+    price = get_price_via_http()
+    if price is None and "--browser" in sys.argv[1:]:
+        print("Price not found in the HTML; falling back to the browser...")
+        price = run_scraper(persistent=False)
+    if price:
+        print(f"\n✅ Tata Power (NSE) Stock Price: {price}\n")
+    else:
+        print("\n❌ Could not locate the price. UI may have changed.\n")
 
 if __name__ == "__main__":
     main()
@@ -4,10 +4,18 @@ from sqlalchemy import create_engine, text
 
 load_dotenv()
 url = os.getenv("NEON_DB_URL")
-print("NEON_DB_URL =", url)
 
-engine = create_engine(url)
+# Module-level engine with a small warm pool, so scripts importing this reuse it
+engine = create_engine(
+    url,
+    pool_pre_ping=True,  # Neon closes idle connections; test before handing one out
+    pool_size=5,
+    pool_recycle=1800,
+    future=True,
+)
 
-with engine.connect() as conn:
-    result = conn.execute(text("SELECT 1"))
-    print("DB OK, SELECT 1 ->", list(result))
+if __name__ == "__main__":
+    print("NEON_DB_URL =", url)
+    with engine.connect() as conn:
+        result = conn.execute(text("SELECT 1"))
+        print("DB OK, SELECT 1 ->", list(result))